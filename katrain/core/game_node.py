@@ -1,5 +1,6 @@
 import base64
 import copy
+import functools
 import gzip
 import json
 import random
@@ -17,15 +18,25 @@ from katrain.core.constants import (
 )
 from katrain.core.lang import i18n
 from katrain.core.sgf_parser import Move, SGFNode
-from katrain.core.utils import evaluation_class, pack_floats, unpack_floats, var_to_grid
+from katrain.core.utils import argsort, evaluation_class, pack_floats, unpack_floats
 from katrain.gui.theme import Theme
 
+PLAYER_SIGN = {"B": 1, "W": -1, None: 0}
+DERIVED_MOVE_KEYS = ["pointsLost", "relativePointsLost", "winrateLost"]  # set on analysis updates, not saved
+
+
+@functools.lru_cache(maxsize=4096)
+def gtp_to_sgf(gtp: str, board_size: Tuple[int, int]) -> str:
+    return Move.from_gtp(gtp).sgf(board_size)
+
 
 def analysis_dumps(analysis):
     analysis = copy.deepcopy(analysis)
     for movedict in analysis["moves"].values():
         if "ownership" in movedict:  # per-move ownership rarely used
             del movedict["ownership"]
+        for key in DERIVED_MOVE_KEYS:
+            movedict.pop(key, None)
     ownership_data = pack_floats(analysis.pop("ownership"))
     policy_data = pack_floats(analysis.pop("policy"))
     main_data = json.dumps(analysis).encode("utf-8")
@@ -38,6 +49,10 @@ def analysis_dumps(analysis):
 class GameNode(SGFNode):
     """Represents a single game node, with one or more moves and placements."""
 
+    _FLAT_COORDS: Dict[Tuple[int, int], List[Optional[Tuple[int, int]]]] = {}  # board size -> coords by policy index
+    _FLAT_MOVES: Dict[Tuple[Tuple[int, int], str], List[Move]] = {}  # (board size, player) -> moves by policy index
+    _TIE_ORDER: Dict[Tuple[int, int], List[int]] = {}  # board size -> policy indices by column, then row, pass last
+
     def __init__(self, parent=None, properties=None, move=None):
         super().__init__(parent=parent, properties=properties, move=move)
         self.auto_undo = None  # None = not analyzed. False: not undone (good move). True: undone (bad move)
@@ -46,13 +61,23 @@ class GameNode(SGFNode):
         self.note = ""
         self.move_number = 0
         self.time_used = 0
-        self.undo_threshold = random.random()  # for fractional undos
+        self._undo_threshold = None  # for fractional undos, drawn on first use
         self.end_state = None
         self.shortcuts_to = []
         self.shortcut_from = None
         self.analysis_from_sgf = None
+        self._analysis_version = 0  # bumped whenever analysis changes, invalidates cached derived values
+        self._candidate_moves_cache = None  # (analysis version, candidate moves)
+        self._policy_ranking_cache = None  # (policy, policy ranking)
+        self._policy_rank_map_cache = None  # (policy, {move: (rank, policy value)})
         self.clear_analysis()
 
+    @property
+    def undo_threshold(self) -> float:
+        if self._undo_threshold is None:
+            self._undo_threshold = random.random()
+        return self._undo_threshold
+
     def add_shortcut(self, to_node):  # collapses the branch between them
         nodes = [to_node]
         while nodes[-1].parent and nodes[-1] != self:  # ensure on path
@@ -85,6 +110,9 @@ class GameNode(SGFNode):
                 "policy": unpack_floats(policy_data, board_squares + 1),
                 "ownership": unpack_floats(ownership_data, board_squares),
             }
+            self._cache_root_analysis()
+            self.analysis["moves"] = self._with_derived_values(self.analysis["moves"])
+            self._analysis_version += 1
             return True
         except Exception as e:
             print(f"Error in loading analysis: {e}")
@@ -107,6 +135,14 @@ class GameNode(SGFNode):
     def clear_analysis(self):
         self.analysis_visits_requested = 0
         self.analysis = {"moves": {}, "root": None, "ownership": None, "policy": None, "completed": False}
+        self._cache_root_analysis()
+        self._analysis_version += 1
+
+    def _cache_root_analysis(self):  # flattened root values, for the frequently used score/winrate properties
+        root_info = self.analysis["root"]
+        self._analysis_ready = root_info is not None
+        self._score_lead = root_info.get("scoreLead") if self._analysis_ready else None
+        self._winrate = root_info.get("winrate") if self._analysis_ready else None
 
     def sgf_properties(
         self,
@@ -116,15 +152,16 @@ class GameNode(SGFNode):
         save_analysis=False,
         save_marks=False,
     ):
-        properties = copy.copy(super().sgf_properties())
+        properties = super().sgf_properties()  # already a fresh deep copy, safe to modify
         note = self.note.strip()
         if save_analysis and self.analysis_complete:
             try:
                 properties["KT"] = analysis_dumps(self.analysis)
             except Exception as e:
                 print(f"Error in saving analysis: {e}")
-        if self.points_lost and save_comments_class is not None and eval_thresholds is not None:
-            show_class = save_comments_class[evaluation_class(self.points_lost, eval_thresholds)]
+        points_lost = self.points_lost
+        if points_lost and save_comments_class is not None and eval_thresholds is not None:
+            show_class = save_comments_class[evaluation_class(points_lost, eval_thresholds)]
         else:
             show_class = False
         comments = properties.get("C", [])
@@ -136,9 +173,10 @@ class GameNode(SGFNode):
         ):
             if save_marks:
                 candidate_moves = self.parent.candidate_moves
-                top_x = Move.from_gtp(candidate_moves[0]["move"]).sgf(self.board_size)
+                board_size = self.board_size
+                top_x = gtp_to_sgf(candidate_moves[0]["move"], board_size)
                 best_sq = [
-                    Move.from_gtp(d["move"]).sgf(self.board_size)
+                    gtp_to_sgf(d["move"], board_size)
                     for d in candidate_moves
                     if d["pointsLost"] <= 0.5 and d["move"] != "pass" and d["order"] != 0
                 ]
@@ -211,22 +249,45 @@ class GameNode(SGFNode):
             report_every=report_every,
         )
 
-    def update_move_analysis(self, move_analysis, move_gtp):
-        cur = self.analysis["moves"].get(move_gtp)
+    @staticmethod
+    def _merge_move_analysis(cur, move_analysis, move_gtp):
         if cur is None:
-            self.analysis["moves"][move_gtp] = {
+            return {
                 "move": move_gtp,
                 "order": ADDITIONAL_MOVE_ORDER,
                 **move_analysis,
             }  # some default values for keys missing in rootInfo
-        else:
-            cur["order"] = min(
-                cur["order"], move_analysis.get("order", ADDITIONAL_MOVE_ORDER)
-            )  # parent arriving after child
-            if cur["visits"] < move_analysis["visits"]:
-                cur.update(move_analysis)
-            else:  # prior etc only
-                cur.update({k: v for k, v in move_analysis.items() if k not in cur})
+        # always a new dict: entries already in analysis["moves"] may be held by readers and are never modified
+        order = min(cur["order"], move_analysis.get("order", ADDITIONAL_MOVE_ORDER))  # parent arriving after child
+        if cur["visits"] < move_analysis["visits"]:
+            return {**cur, "order": order, **move_analysis}
+        else:  # prior etc only
+            return {**move_analysis, **cur, "order": order}
+
+    def update_move_analysis(self, move_analysis, move_gtp):
+        moves = self.analysis["moves"]
+        self.analysis["moves"] = self._with_derived_values(
+            {**moves, move_gtp: self._merge_move_analysis(moves.get(move_gtp), move_analysis, move_gtp)}
+        )
+        self._analysis_version += 1
+
+    def _with_derived_values(self, moves: Dict[str, Dict]) -> Dict[str, Dict]:
+        """Copies of the move dicts with points/winrate lost filled in, computed once per update rather than per read"""
+        if not self._analysis_ready:
+            return moves
+        root_score, root_winrate = self._score_lead, self._winrate
+        top_move = [d for d in moves.values() if d["order"] == 0]
+        top_score_lead = top_move[0]["scoreLead"] if top_move else root_score
+        sign = self.player_sign(self.next_player)
+        return {
+            gtp: {
+                **d,
+                "pointsLost": sign * (root_score - d["scoreLead"]),
+                "relativePointsLost": sign * (top_score_lead - d["scoreLead"]),
+                "winrateLost": sign * (root_winrate - d["winrate"]),
+            }
+            for gtp, d in moves.items()
+        }
 
     def set_analysis(
         self,
@@ -242,18 +303,24 @@ class GameNode(SGFNode):
                 {"pv": [refine_move.gtp()] + pvtail, **analysis_json["rootInfo"]}, refine_move.gtp()
             )
         else:
+            # merge into new dicts and swap them in at once, so readers see either the old or the new analysis
             if additional_moves:  # additional moves: old order matters, ignore new order
                 for m in analysis_json["moveInfos"]:
                     del m["order"]
-            elif refine_move is None:  # normal update: old moves to end, new order matters. also for region?
-                for move_dict in self.analysis["moves"].values():
-                    move_dict["order"] = ADDITIONAL_MOVE_ORDER  # old moves to end
+                moves = dict(self.analysis["moves"])
+            else:  # normal update: old moves to end, new order matters. also for region?
+                moves = {gtp: {**d, "order": ADDITIONAL_MOVE_ORDER} for gtp, d in self.analysis["moves"].items()}
             for move_analysis in analysis_json["moveInfos"]:
-                self.update_move_analysis(move_analysis, move_analysis["move"])
+                move_gtp = move_analysis["move"]
+                moves[move_gtp] = self._merge_move_analysis(moves.get(move_gtp), move_analysis, move_gtp)
             self.analysis["ownership"] = analysis_json.get("ownership")
             self.analysis["policy"] = analysis_json.get("policy")
-            if not additional_moves and not region_of_interest:
+            update_root = not additional_moves and not region_of_interest
+            if update_root:
                 self.analysis["root"] = analysis_json["rootInfo"]
+                self._cache_root_analysis()
+            self.analysis["moves"] = self._with_derived_values(moves)  # after the root, which they depend on
+            if update_root:
                 if self.parent and self.move:
                     analysis_json["rootInfo"]["pv"] = [self.move.gtp()] + (
                         analysis_json["moveInfos"][0]["pv"] if analysis_json["moveInfos"] else []
@@ -263,6 +330,7 @@ class GameNode(SGFNode):
                     )  # update analysis in parent for consistency
             is_normal_query = refine_move is None and not additional_moves
             self.analysis["completed"] = self.analysis["completed"] or (is_normal_query and not partial_result)
+            self._analysis_version += 1  # after all changes, so a concurrent reader can not cache a partial update
 
     @property
     def ownership(self):
@@ -274,11 +342,11 @@ class GameNode(SGFNode):
 
     @property
     def analysis_exists(self):
-        return self.analysis["root"] is not None
+        return self._analysis_ready
 
     @property
     def analysis_complete(self):
-        return self.analysis["completed"] and self.analysis["root"] is not None
+        return self.analysis["completed"] and self._analysis_ready
 
     @property
     def root_visits(self):
@@ -286,36 +354,33 @@ class GameNode(SGFNode):
 
     @property
     def score(self) -> Optional[float]:
-        if self.analysis_exists:
-            return self.analysis["root"].get("scoreLead")
+        return self._score_lead
 
     def format_score(self, score=None):
-        score = score or self.score
+        score = score if score is not None else self.score
         if score is not None:
-            leading_player = 'B' if score >= 0 else 'W'
+            leading_player = ("W", "B")[score >= 0]
             leading_player_color = i18n._(f"short color {leading_player}")
             return f"{leading_player_color}+{abs(score):.1f}"
 
     @property
     def winrate(self) -> Optional[float]:
-        if self.analysis_exists:
-            return self.analysis["root"].get("winrate")
+        return self._winrate
 
     def format_winrate(self, win_rate=None):
-        win_rate = win_rate or self.winrate
+        win_rate = win_rate if win_rate is not None else self.winrate
         if win_rate is not None:
-            leading_player = 'B' if win_rate > 0.5 else 'W'
+            leading_player = ("W", "B")[win_rate > 0.5]
             leading_player_color = i18n._(f"short color {leading_player}")
-            return f"{leading_player_color} {max(win_rate,1-win_rate):.1%}"
+            return f"{leading_player_color} {abs(win_rate - 0.5) + 0.5:.1%}"
 
     def move_policy_stats(self) -> Tuple[Optional[int], float, List]:
         single_move = self.move
         if single_move and self.parent:
-            policy_ranking = self.parent.policy_ranking
-            if policy_ranking:
-                for ix, (p, m) in enumerate(policy_ranking):
-                    if m == single_move:
-                        return ix + 1, p, policy_ranking
+            rank_and_policy = self.parent.policy_rank_map.get(single_move)
+            if rank_and_policy:
+                rank, p = rank_and_policy
+                return rank + 1, p, self.parent.policy_ranking
         return None, 0.0, []
 
     def make_pv(self, player, pv, interactive):
@@ -334,22 +399,22 @@ class GameNode(SGFNode):
                 return f"{i18n._('komi')}: {self.komi:.1f}\n{i18n._('ruleset')}: {rules}\n"
             return ""
 
-        text = i18n._("move").format(number=self.depth) + f": {single_move.player} {single_move.gtp()}\n"
+        lines = [i18n._("move").format(number=self.depth) + f": {single_move.player} {single_move.gtp()}\n"]
         if self.analysis_exists:
             score = self.score
             if sgf:
-                text += i18n._("Info:score").format(score=self.format_score(score)) + "\n"
-                text += i18n._("Info:winrate").format(winrate=self.format_winrate()) + "\n"
+                lines.append(i18n._("Info:score").format(score=self.format_score(score)) + "\n")
+                lines.append(i18n._("Info:winrate").format(winrate=self.format_winrate()) + "\n")
             if self.parent and self.parent.analysis_exists:
-                previous_top_move = self.parent.candidate_moves[0]
+                previous_top_move = self.parent.top_candidate_move
                 if sgf or details:
                     if previous_top_move["move"] != single_move.gtp():
-                        points_lost = self.points_lost
+                        points_lost = self._compute_points_lost(self.parent.score)
                         if sgf and points_lost > 0.5:
-                            text += i18n._("Info:point loss").format(points_lost=points_lost) + "\n"
+                            lines.append(i18n._("Info:point loss").format(points_lost=points_lost) + "\n")
                         top_move = previous_top_move["move"]
                         score = self.format_score(previous_top_move["scoreLead"])
-                        text += (
+                        lines.append(
                             i18n._("Info:top move").format(
                                 top_move=top_move,
                                 score=score,
@@ -357,42 +422,48 @@ class GameNode(SGFNode):
                             + "\n"
                         )
                     else:
-                        text += i18n._("Info:best move") + "\n"
+                        lines.append(i18n._("Info:best move") + "\n")
                     if previous_top_move.get("pv") and (sgf or details):
                         pv = self.make_pv(single_move.player, previous_top_move["pv"], interactive)
-                        text += i18n._("Info:PV").format(pv=pv) + "\n"
+                        lines.append(i18n._("Info:PV").format(pv=pv) + "\n")
                 if sgf or details or teach:
                     currmove_pol_rank, currmove_pol_prob, policy_ranking = self.move_policy_stats()
                     if currmove_pol_rank is not None:
                         policy_rank_msg = i18n._("Info:policy rank")
-                        text += policy_rank_msg.format(rank=currmove_pol_rank, probability=currmove_pol_prob) + "\n"
+                        lines.append(
+                            policy_rank_msg.format(rank=currmove_pol_rank, probability=currmove_pol_prob) + "\n"
+                        )
                     if currmove_pol_rank != 1 and policy_ranking and (sgf or details):
                         policy_best_msg = i18n._("Info:policy best")
                         pol_move, pol_prob = policy_ranking[0][1].gtp(), policy_ranking[0][0]
-                        text += policy_best_msg.format(move=pol_move, probability=pol_prob) + "\n"
+                        lines.append(policy_best_msg.format(move=pol_move, probability=pol_prob) + "\n")
             if self.auto_undo and sgf:
-                text += i18n._("Info:teaching undo") + "\n"
-                top_pv = self.analysis_exists and self.candidate_moves[0].get("pv")
+                lines.append(i18n._("Info:teaching undo") + "\n")
+                top_pv = self.analysis_exists and self.top_candidate_move.get("pv")
                 if top_pv:
-                    text += i18n._("Info:undo predicted PV").format(pv=f"{self.next_player}{' '.join(top_pv)}") + "\n"
+                    lines.append(
+                        i18n._("Info:undo predicted PV").format(pv=f"{self.next_player}{' '.join(top_pv)}") + "\n"
+                    )
         else:
-            text = i18n._("No analysis available") if sgf else i18n._("Analyzing move...")
+            lines = [i18n._("No analysis available") if sgf else i18n._("Analyzing move...")]
 
         if self.ai_thoughts and (sgf or details):
-            text += "\n" + i18n._("Info:AI thoughts").format(thoughts=self.ai_thoughts)
+            lines.append("\n" + i18n._("Info:AI thoughts").format(thoughts=self.ai_thoughts))
 
         if "C" in self.properties:
-            text += "\n[u]SGF Comments:[/u]\n" + "\n".join(self.properties["C"])
+            lines.append("\n[u]SGF Comments:[/u]\n" + "\n".join(self.properties["C"]))
 
-        return text
+        return "".join(lines)
 
     @property
     def points_lost(self) -> Optional[float]:
+        if self.parent and self.parent._analysis_ready:
+            return self._compute_points_lost(self.parent._score_lead)
+
+    def _compute_points_lost(self, parent_score: float) -> Optional[float]:  # parent analysis already checked
         single_move = self.move
-        if single_move and self.parent and self.analysis_exists and self.parent.analysis_exists:
-            parent_score = self.parent.score
-            score = self.score
-            return self.player_sign(single_move.player) * (parent_score - score)
+        if single_move and self._analysis_ready:
+            return self.player_sign(single_move.player) * (parent_score - self._score_lead)
 
     @property
     def parent_realized_points_lost(self) -> Optional[float]:
@@ -401,19 +472,35 @@ class GameNode(SGFNode):
             single_move
             and self.parent
             and self.parent.parent
-            and self.analysis_exists
-            and self.parent.parent.analysis_exists
+            and self._analysis_ready
+            and self.parent.parent._analysis_ready
         ):
-            parent_parent_score = self.parent.parent.score
-            score = self.score
-            return self.player_sign(single_move.player) * (score - parent_parent_score)
+            return self.player_sign(single_move.player) * (self._score_lead - self.parent.parent._score_lead)
 
     @staticmethod
     def player_sign(player):
-        return {"B": 1, "W": -1, None: 0}[player]
+        return PLAYER_SIGN[player]
 
     @property
     def candidate_moves(self) -> List[Dict]:
+        if self._candidate_moves_cache is not None and self._candidate_moves_cache[0] == self._analysis_version:
+            return self._candidate_moves_cache[1]
+        version = self._analysis_version  # read before calculating, so any concurrent update invalidates the result
+        candidate_moves = self._calculate_candidate_moves()
+        self._candidate_moves_cache = (version, candidate_moves)
+        return candidate_moves
+
+    def top_candidate_moves(self, k: int) -> List[Dict]:  # candidate_moves[:k], without a full sort if not cached
+        if self._candidate_moves_cache is not None and self._candidate_moves_cache[0] == self._analysis_version:
+            return self._candidate_moves_cache[1][:k]
+        return self._calculate_candidate_moves(top_k=k)
+
+    @property
+    def top_candidate_move(self) -> Optional[Dict]:
+        candidate_moves = self.top_candidate_moves(1)
+        return candidate_moves[0] if candidate_moves else None
+
+    def _calculate_candidate_moves(self, top_k: Optional[int] = None) -> List[Dict]:
         if not self.analysis_exists:
             return []
         if not self.analysis["moves"]:
@@ -430,29 +517,62 @@ class GameNode(SGFNode):
                 }
             ]  # single visit -> go by policy/root
 
-        root_score = self.analysis["root"]["scoreLead"]
-        root_winrate = self.analysis["root"]["winrate"]
         move_dicts = list(self.analysis["moves"].values())  # prevent incoming analysis from causing crash
-        top_move = [d for d in move_dicts if d["order"] == 0]
-        top_score_lead = top_move[0]["scoreLead"] if top_move else root_score
-        return sorted(
-            [
-                {
-                    "pointsLost": self.player_sign(self.next_player) * (root_score - d["scoreLead"]),
-                    "relativePointsLost": self.player_sign(self.next_player) * (top_score_lead - d["scoreLead"]),
-                    "winrateLost": self.player_sign(self.next_player) * (root_winrate - d["winrate"]),
-                    **d,
-                }
-                for d in move_dicts
-            ],
-            key=lambda d: (d["order"], d["pointsLost"]),
-        )
+        # points lost is filled in on update and entries are never modified, so they are returned without copying
+        ranked = argsort([(d["order"], d["pointsLost"]) for d in move_dicts], top_k=top_k)
+        return [move_dicts[ix] for ix in ranked]
 
     @property
     def policy_ranking(self) -> Optional[List[Tuple[float, Move]]]:  # return moves from highest policy value to lowest
-        if self.policy:
-            szx, szy = self.board_size
-            policy_grid = var_to_grid(self.policy, size=(szx, szy))
-            moves = [(policy_grid[y][x], Move((x, y), player=self.next_player)) for x in range(szx) for y in range(szy)]
-            moves.append((self.policy[-1], Move(None, player=self.next_player)))
-            return sorted(moves, key=lambda mp: -mp[0])
+        policy = self.policy
+        if self._policy_ranking_cache is not None and self._policy_ranking_cache[0] is policy:
+            return self._policy_ranking_cache[1]
+        policy_ranking = self._calculate_policy_ranking()
+        self._policy_ranking_cache = (policy, policy_ranking)  # policy is replaced wholesale, never mutated
+        return policy_ranking
+
+    def _calculate_policy_ranking(self) -> Optional[List[Tuple[float, Move]]]:
+        policy = self.policy
+        if policy:
+            board_size = self.board_size
+            moves = self.flat_moves(board_size, self.next_player)
+            ranked = argsort(policy, reverse=True, indices=self.policy_tie_order(board_size))
+            return [(policy[ix], moves[ix]) for ix in ranked]
+
+    @classmethod
+    def flat_coords(cls, board_size: Tuple[int, int]) -> List[Optional[Tuple[int, int]]]:
+        """Coordinates for each index of a flat policy vector, in var_to_grid order, with None (pass) last"""
+        coords = cls._FLAT_COORDS.get(board_size)
+        if coords is None:
+            szx, szy = board_size
+            coords = [(x, y) for y in range(szy - 1, -1, -1) for x in range(szx)] + [None]
+            cls._FLAT_COORDS[board_size] = coords
+        return coords
+
+    @classmethod
+    def flat_moves(cls, board_size: Tuple[int, int], player: str) -> List[Move]:
+        """Shared Move objects for each index of a flat policy vector. Moves are never modified, so reuse is safe"""
+        moves = cls._FLAT_MOVES.get((board_size, player))
+        if moves is None:
+            moves = [Move(coords, player=player) for coords in cls.flat_coords(board_size)]
+            cls._FLAT_MOVES[(board_size, player)] = moves
+        return moves
+
+    @classmethod
+    def policy_tie_order(cls, board_size: Tuple[int, int]) -> List[int]:
+        """Flat policy indices in the order equal policy values are ranked: x-major from A1, with pass last"""
+        order = cls._TIE_ORDER.get(board_size)
+        if order is None:
+            szx, szy = board_size
+            order = [(szy - 1 - y) * szx + x for x in range(szx) for y in range(szy)] + [szx * szy]
+            cls._TIE_ORDER[board_size] = order
+        return order
+
+    @property
+    def policy_rank_map(self) -> Dict[Move, Tuple[int, float]]:  # zero-based rank and policy value by move
+        policy = self.policy
+        if self._policy_rank_map_cache is not None and self._policy_rank_map_cache[0] is policy:
+            return self._policy_rank_map_cache[1]
+        rank_map = {m: (rank, p) for rank, (p, m) in enumerate(self.policy_ranking or [])}
+        self._policy_rank_map_cache = (policy, rank_map)
+        return rank_map
@@ -19,7 +19,10 @@ class Lang(Observable):
         self.switch_lang(lang)
 
     def _(self, text):
-        return self.ugettext(text)
+        translation = self.translation_cache.get(text)
+        if translation is None:  # memoized, as gettext walks the fallback chain on every lookup
+            translation = self.translation_cache[text] = self.ugettext(text)
+        return translation
 
     def set_widget_font(self, widget):
         widget.font_name = self.font_name
@@ -58,6 +61,7 @@ class Lang(Observable):
         locale_dir = os.path.join(i18n_dir, "locales")
         locales = gettext.translation("katrain", locale_dir, languages=[lang, DEFAULT_LANGUAGE])
         self.ugettext = locales.gettext
+        self.translation_cache = {}
 
         # update all the kv rules attached to this text
         for widget, func, args in self.observers:
@@ -4,7 +4,7 @@ from pathlib import Path
 import random
 import struct
 import sys
-from typing import List, Tuple, TypeVar
+from typing import List, Optional, Sequence, Tuple, TypeVar
 
 import importlib.resources as pkg_resources
 
@@ -22,6 +22,17 @@ def var_to_grid(array_var: List[T], size: Tuple[int, int]) -> List[List[T]]:
     return grid
 
 
+def argsort(
+    values: Sequence, reverse: bool = False, top_k: Optional[int] = None, indices: Optional[Sequence[int]] = None
+) -> List[int]:
+    """indices that sort values, keeping ties in the order of indices (default: all in order), optionally top_k only"""
+    if indices is None:
+        indices = range(len(values))
+    if top_k is None:
+        return sorted(indices, key=values.__getitem__, reverse=reverse)
+    return (heapq.nlargest if reverse else heapq.nsmallest)(top_k, indices, key=values.__getitem__)
+
+
 def evaluation_class(points_lost: float, eval_thresholds: List[float]):
     i = 0
     while i < len(eval_thresholds) - 1 and points_lost < eval_thresholds[i]:
@@ -216,7 +216,7 @@ class BadukPanWidget(Widget):
                     katrain.controls.info.text = nodes_here[-1].comment(sgf=True)
                     katrain.controls.active_comment_node = nodes_here[-1]
                     if nodes_here[-1].parent.analysis_exists:
-                        self.set_animating_pv(nodes_here[-1].parent.candidate_moves[0]["pv"], nodes_here[-1].parent)
+                        self.set_animating_pv(nodes_here[-1].parent.top_candidate_move["pv"], nodes_here[-1].parent)
 
         self.ghost_stone = None
         self.redraw_hover_contents_trigger()  # remove ghost
@@ -1033,7 +1033,7 @@ class BadukPanWidget(Widget):
                     if move and move.coords is not None:
                         if child_node.analysis_exists:
                             self.active_pv_moves.append(
-                                (move.coords, [move.gtp()] + child_node.candidate_moves[0]["pv"], current_node)
+                                (move.coords, [move.gtp()] + child_node.top_candidate_move["pv"], current_node)
                             )
 
                         if move.coords != top_move_coords:  # for contrast
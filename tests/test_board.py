@@ -1,9 +1,14 @@
+import base64
+import gzip
+import json
+
 import pytest
 
 from katrain.core.base_katrain import KaTrainBase
 from katrain.core.engine import BaseEngine
 from katrain.core.game import Game, IllegalMoveException, Move, KaTrainSGF
-from katrain.core.game_node import GameNode
+from katrain.core.game_node import GameNode, analysis_dumps
+from katrain.core.utils import var_to_grid
 
 
 class MockKaTrain(KaTrainBase):
@@ -15,6 +20,17 @@ class MockEngine:
         pass
 
 
+def mock_analysis(move_scores, root_score=0.0, policy=None):
+    return {
+        "rootInfo": {"scoreLead": root_score, "winrate": 0.5, "visits": 100},
+        "moveInfos": [
+            {"move": gtp, "order": order, "visits": 10, "scoreLead": score, "winrate": 0.5, "pv": [gtp]}
+            for order, (gtp, score) in enumerate(move_scores)
+        ],
+        "policy": policy,
+    }
+
+
 @pytest.fixture
 def new_game():
     return GameNode(properties={"SZ": 19})
@@ -140,3 +156,113 @@ class TestBoard:
                     b.play(Move.from_gtp("B19", player="W"))
                 assert 4 == len(b.stones)
                 assert 0 == len(b.prisoners)
+
+    def test_candidate_moves_cache(self, new_game):
+        new_game.set_analysis(mock_analysis([("D4", 1.0), ("Q16", 0.5)], root_score=1.0))
+        candidates = new_game.candidate_moves
+        assert [d["move"] for d in candidates] == ["D4", "Q16"]
+        assert candidates is new_game.candidate_moves
+        new_game.set_analysis(mock_analysis([("C3", 2.0), ("D4", 1.5)], root_score=2.0))
+        assert [d["move"] for d in new_game.candidate_moves] == ["C3", "D4", "Q16"]
+        new_game.clear_analysis()
+        assert new_game.candidate_moves == []
+
+    def test_policy_ranking(self):
+        node = GameNode(properties={"SZ": "3:2"})
+        node.set_analysis(mock_analysis([], policy=[0.1, 0.0, 0.2, 0.05, 0.4, 0.15, 0.1]))
+        ranking = node.policy_ranking
+        assert [m.gtp() for _, m in ranking[:4]] == ["B1", "C2", "C1", "A2"]
+        assert ranking[0][0] == 0.4
+        assert len(ranking) == 7 and Move(None, player="B") in [m for _, m in ranking]
+
+    def test_move_policy_stats(self):
+        root = GameNode(properties={"SZ": "3:2"})
+        root.set_analysis(mock_analysis([], policy=[0.1, 0.0, 0.2, 0.05, 0.4, 0.15, 0.1]))
+        node = GameNode(parent=root, move=Move.from_gtp("C1", player="B"))
+        rank, prob, ranking = node.move_policy_stats()
+        assert (rank, prob) == (3, 0.15)
+        assert ranking is root.policy_ranking
+        assert GameNode(parent=root, move=Move.from_gtp("C1", player="W")).move_policy_stats() == (None, 0.0, [])
+
+    def test_top_candidate_move(self, new_game):
+        assert new_game.top_candidate_move is None
+        new_game.set_analysis(mock_analysis([("D4", 1.0), ("Q16", 0.5)], root_score=1.0))
+        new_game.set_analysis(mock_analysis([("C3", 2.0)], root_score=2.0), additional_moves=True)
+        top_move = new_game.top_candidate_move
+        assert top_move["move"] == "D4" and top_move["pointsLost"] == 0.0
+        assert top_move == new_game.candidate_moves[0]
+
+    def test_top_candidate_moves(self, new_game):
+        new_game.set_analysis(mock_analysis([("D4", 1.0), ("Q16", 0.5), ("C3", 0.2)], root_score=1.0))
+        new_game.set_analysis(mock_analysis([("K10", 3.0)], root_score=1.0), additional_moves=True)
+        top_moves = new_game.top_candidate_moves(2)
+        assert [d["move"] for d in top_moves] == ["D4", "Q16"]
+        assert top_moves == new_game.candidate_moves[:2]
+        assert new_game.top_candidate_moves(2) == top_moves  # cached
+
+    def test_derived_move_keys_not_saved(self, new_game):
+        new_game.set_analysis(mock_analysis([("D4", 1.0), ("Q16", 0.5)], root_score=1.0))
+        assert new_game.candidate_moves[1]["pointsLost"] == 0.5
+        *_, main_data = analysis_dumps(new_game.analysis)
+        saved_moves = json.loads(gzip.decompress(base64.standard_b64decode(main_data)))["moves"]
+        assert "pointsLost" not in saved_moves["Q16"]
+        assert "pointsLost" in new_game.analysis["moves"]["Q16"]
+
+    def test_format_score_winrate(self, new_game):
+        new_game.set_analysis(mock_analysis([("D4", 3.0)], root_score=3.0))
+        assert new_game.format_score() == "B+3.0"
+        assert new_game.format_score(-2.5) == "W+2.5"
+        assert new_game.format_score(0.0) == "B+0.0"
+        assert new_game.format_winrate(0.25) == "W 75.0%"
+        assert new_game.format_winrate(0.0) == "W 100.0%"
+
+    def test_flat_coords_match_var_to_grid(self):
+        for board_size in [(19, 19), (9, 13), (13, 9)]:
+            szx, szy = board_size
+            policy = list(range(szx * szy + 1))
+            policy_grid = var_to_grid(policy, board_size)
+            coords = GameNode.flat_coords(board_size)
+            assert coords[-1] is None
+            assert all(policy_grid[y][x] == ix for ix, (x, y) in enumerate(coords[:-1]))
+
+    def test_policy_ranking_shares_moves(self):
+        nodes = [GameNode(properties={"SZ": "3:2"}) for _ in range(2)]
+        for node in nodes:
+            node.set_analysis(mock_analysis([], policy=[0.1, 0.0, 0.2, 0.05, 0.4, 0.15, 0.1]))
+        assert nodes[0].policy_ranking[0][1] is nodes[1].policy_ranking[0][1]
+        assert nodes[0].policy_ranking[0][1] == Move.from_gtp("B1", player="B")
+
+    def test_root_analysis_cache(self, new_game):
+        assert not new_game.analysis_exists and new_game.score is None
+        new_game.set_analysis(mock_analysis([("D4", 1.5)], root_score=1.5))
+        assert new_game.analysis_exists and new_game.score == 1.5 and new_game.winrate == 0.5
+        saved = analysis_dumps(new_game.analysis)
+        new_game.clear_analysis()
+        assert not new_game.analysis_exists and new_game.score is None
+        new_game.analysis_from_sgf = saved
+        assert new_game.load_analysis()
+        assert new_game.analysis_exists and new_game.score == 1.5
+
+    def test_policy_ranking_ties(self):
+        node = GameNode(properties={"SZ": "3:2"})
+        node.set_analysis(mock_analysis([], policy=[0.1] * 7))
+        assert [m.gtp() for _, m in node.policy_ranking] == ["A1", "A2", "B1", "B2", "C1", "C2", "pass"]
+
+    def test_sgf_marks_include_late_order_moves(self, new_game):
+        moves = [(Move((i % 19, i // 19)).gtp(), 1.0 if i == 0 or i >= 35 else -5.0) for i in range(50)]
+        new_game.set_analysis(mock_analysis(moves, root_score=1.0))
+        node = GameNode(parent=new_game, move=Move.from_gtp("A1", player="B"))
+        node.set_analysis(mock_analysis([("B2", 1.0)], root_score=1.0))
+        node.note = "note"
+        assert len(node.sgf_properties(save_marks=True)["SQ"]) == 15
+
+    def test_candidate_moves_not_modified_by_updates(self, new_game):
+        new_game.set_analysis(mock_analysis([("D4", 1.0), ("Q16", 0.5)], root_score=1.0))
+        held = new_game.candidate_moves
+        snapshot = [dict(d) for d in held]
+        new_game.set_analysis(mock_analysis([("Q16", 0.0), ("D4", -1.0)], root_score=0.0))
+        new_game.set_analysis(mock_analysis([("C3", 2.0)], root_score=0.0), additional_moves=True)
+        assert new_game.top_candidate_move["move"] == "Q16"
+        assert [dict(d) for d in held] == snapshot
+        assert all(d["pointsLost"] == -d["scoreLead"] for d in new_game.analysis["moves"].values())
+        assert [d["pointsLost"] for d in new_game.candidate_moves] == [-0.5, -1.0, -2.0]  # same visits keep old scores